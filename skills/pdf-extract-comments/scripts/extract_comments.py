@@ -8,7 +8,15 @@ extract referenced text using quadpoints to match the highlighted span.
 
 import argparse
 import json
+import mmap
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
 
 
 def require_pymupdf():
@@ -20,6 +28,23 @@ def require_pymupdf():
         sys.exit(2)
 
 
+def open_pdf(pymupdf, path):
+    # Map the file read-only instead of reading it through stdio; the
+    # document keeps the memoryview, and with it the mapping, alive.
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return pymupdf.open(stream=memoryview(mm), filetype="pdf")
+
+
+def format_json(results):
+    # orjson is an optional speedup; the stdlib fallback produces the same
+    # UTF-8 bytes.
+    if orjson is None:
+        return (json.dumps(results, indent=2, ensure_ascii=False) + "\n").encode("utf-8")
+    option = orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE
+    return orjson.dumps(results, option=option)
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description="Extract comments from a PDF using PyMuPDF."
@@ -34,7 +59,7 @@ def parse_args():
     return parser.parse_args()
 
 
-def quad_rects(pymupdf, vertices):
+def quad_rects(vertices):
     rects = []
     if not vertices:
         return rects
@@ -42,16 +67,16 @@ def quad_rects(pymupdf, vertices):
         quad = vertices[i : i + 4]
         xs = [p[0] for p in quad]
         ys = [p[1] for p in quad]
-        rects.append(pymupdf.Rect(min(xs), min(ys), max(xs), max(ys)))
-    rects.sort(key=lambda r: (r.y0, r.x0))
+        rects.append((min(xs), min(ys), max(xs), max(ys)))
+    rects.sort(key=lambda r: (r[1], r[0]))
     return rects
 
 
-def extract_reference(page, annot, pymupdf):
+def extract_reference(page, annot):
     vertices = getattr(annot, "vertices", None)
-    rects = quad_rects(pymupdf, vertices)
+    rects = quad_rects(vertices)
     if not rects:
-        rects = [annot.rect]
+        rects = [tuple(annot.rect)]
 
     parts = []
     for rect in rects:
@@ -62,39 +87,111 @@ def extract_reference(page, annot, pymupdf):
     return "\n".join(parts).rstrip()
 
 
-def main():
-    args = parse_args()
-    pymupdf = require_pymupdf()
-
-    doc = pymupdf.open(args.pdf)
+def extract_page_comments(page):
     results = []
+    annots = list(page.annots() or [])
+    for annot in annots:
+        info = getattr(annot, "info", {}) or {}
+        content = info.get("content") or ""
+        if not content:
+            continue
+
+        reference = extract_reference(page, annot)
+        results.append({"reference": reference, "text": content})
+    return results
+
+
+MIN_PAGES_PER_WORKER = 8
+
+_worker_doc = None
+
+
+def init_worker(pdf_path):
+    global _worker_doc
+    _worker_doc = open_pdf(require_pymupdf(), pdf_path)
+
+
+def process_page(index):
+    return extract_page_comments(_worker_doc.load_page(index))
+
+
+def available_cpus():
+    # Unlike os.cpu_count(), the affinity mask honours taskset and cgroup
+    # cpusets, but sched_getaffinity() does not exist on every platform.
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
 
-    for pi, page in enumerate(doc, start=1):
-        annots = list(page.annots() or [])
-        for annot in annots:
-            info = getattr(annot, "info", {}) or {}
-            content = info.get("content") or ""
-            if not content:
-                continue
 
-            reference = extract_reference(page, annot, pymupdf)
+def pool_size(page_count, workers=None):
+    # Starting a worker and reopening the PDF in it costs about as much as
+    # extracting a handful of pages, so by default every worker gets at
+    # least MIN_PAGES_PER_WORKER pages and small documents stay in-process.
+    if workers is None:
+        workers = min(available_cpus(), page_count // MIN_PAGES_PER_WORKER)
+    return max(1, min(workers, page_count))
+
+
+def map_pages(pdf_path, page_count, workers):
+    chunksize = max(1, page_count // (4 * workers))
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=(pdf_path,)
+    ) as pool:
+        yield from pool.map(process_page, range(page_count), chunksize=chunksize)
+
+
+def extract_results(pdf_path, workers=None):
+    pymupdf = require_pymupdf()
+
+    doc = open_pdf(pymupdf, pdf_path)
+    page_count = doc.page_count
+    workers = pool_size(page_count, workers)
+    if workers > 1:
+        # Documents are not picklable, so each worker opens its own copy.
+        doc.close()
+        page_results = map_pages(pdf_path, page_count, workers)
+    else:
+        page_results = (extract_page_comments(doc.load_page(index)) for index in range(page_count))
+
+    results = []
+    for pi, page_items in enumerate(page_results, start=1):
+        for item in page_items:
             results.append(
                 {
                     "page": pi,
-                    "reference": reference,
-                    "text": content,
+                    "reference": item["reference"],
+                    "text": item["text"],
                 }
             )
 
-    if args.format == "json":
-        print(json.dumps(results, indent=2))
-        return
+    return results
 
+
+def format_text(results):
+    # Collect the report and write it in one go rather than line by line.
+    out = []
     for i, item in enumerate(results, start=1):
-        print(f"{i}. Page: {item['page']}, Reference: \"{item['reference']}\"")
-        print(f"Comment: \"{item['text']}\"")
+        out.append(f"{i}. Page: {item['page']}, Reference: \"{item['reference']}\"")
+        out.append(f"Comment: \"{item['text']}\"")
         if i != len(results):
-            print()
+            out.append("")
+    return "".join(line + "\n" for line in out)
+
+
+def run(pdf_path, output_format="text", workers=None):
+    results = extract_results(pdf_path, workers)
+    if output_format == "json":
+        return format_json(results).decode("utf-8")
+    return format_text(results)
+
+
+def main():
+    args = parse_args()
+    results = extract_results(args.pdf)
+    if args.format == "json":
+        sys.stdout.buffer.write(format_json(results))
+        return
+    sys.stdout.write(format_text(results))
 
 
 if __name__ == "__main__":
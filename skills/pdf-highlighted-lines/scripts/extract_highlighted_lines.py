@@ -8,9 +8,28 @@ and maps them to enumerated comments like "1. ..." on each page.
 
 import argparse
 import json
-import re
+import mmap
+import os
 import sys
-from math import sqrt
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
+
+COLOR_TABLE = (
+    ("yellow", (1.0, 1.0, 0.0)),
+    ("green", (0.0, 1.0, 0.0)),
+    ("blue", (0.0, 1.0, 1.0)),
+    ("light-blue", (0.6, 0.8, 1.0)),
+    ("red", (1.0, 0.0, 0.0)),
+    ("orange", (1.0, 0.6, 0.0)),
+    ("purple", (0.6, 0.2, 0.8)),
+    ("pink", (1.0, 0.6, 0.8)),
+)
 
 
 def require_pymupdf():
@@ -22,8 +41,25 @@ def require_pymupdf():
         sys.exit(2)
 
 
-def dist(c1, c2):
-    return sqrt(sum((a - b) ** 2 for a, b in zip(c1, c2)))
+def dist_sq(c1, c2):
+    return sum((a - b) ** 2 for a, b in zip(c1, c2))
+
+
+def open_pdf(pymupdf, path):
+    # Map the file read-only instead of reading it through stdio; the
+    # document keeps the memoryview, and with it the mapping, alive.
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return pymupdf.open(stream=memoryview(mm), filetype="pdf")
+
+
+def format_json(results):
+    # orjson is an optional speedup; the stdlib fallback produces the same
+    # UTF-8 bytes.
+    if orjson is None:
+        return (json.dumps(results, indent=2, ensure_ascii=False) + "\n").encode("utf-8")
+    option = orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE
+    return orjson.dumps(results, option=option)
 
 
 def parse_args():
@@ -46,9 +82,11 @@ def intersects(b1, b2):
     return not (x1 < a0 or a1 < x0 or y1 < b0 or b1_ < y0)
 
 
-def extract_lines(page):
-    text_dict = page.get_text("dict")
+def extract_lines(text_dict):
+    # Sort plain (y0, x0, position) tuples, built while collecting, instead
+    # of calling a key function on every line record.
     lines = []
+    keys = []
     for block in text_dict.get("blocks", []):
         if block.get("type") != 0:
             continue
@@ -58,9 +96,26 @@ def extract_lines(page):
             if not line_text:
                 continue
             bbox = line.get("bbox")
-            lines.append({"text": line_text, "lines": [{"text": line_text, "bbox": bbox}]})
-    lines.sort(key=lambda x: (x["lines"][0]["bbox"][1], x["lines"][0]["bbox"][0]))
-    return lines
+            keys.append((bbox[1], bbox[0], len(lines)))
+            lines.append({"text": line_text, "bbox": bbox})
+    keys.sort()
+    return [lines[key[2]] for key in keys]
+
+
+def line_overlaps(lines, rects):
+    # Lines come sorted by top edge, so for each rect only the lines starting
+    # between one maximal line height above it and its bottom edge can
+    # overlap; bisect to that window and test just those.
+    bboxes = [line["bbox"] for line in lines]
+    tops = [b[1] for b in bboxes]
+    max_height = max((b[3] - b[1] for b in bboxes), default=0.0)
+    hits = {}
+    for hi, rect in enumerate(rects):
+        lo = bisect_left(tops, rect[1] - max_height)
+        for li in range(lo, bisect_right(tops, rect[3])):
+            if intersects(bboxes[li], rect):
+                hits.setdefault(li, []).append(hi)
+    return hits
 
 
 def extract_highlight_text(page, rect):
@@ -75,20 +130,80 @@ def rect_to_tuple(rect):
     return (rect.x0, rect.y0, rect.x1, rect.y1)
 
 
-def classify_nearest_color(c, color_table):
+@lru_cache(maxsize=256)
+def nearest_color_label(key, color_table):
+    c = tuple(v / 255 for v in key)
+    label, _ = min(color_table, key=lambda item: dist_sq(c, item[1]))
+    return label
+
+
+def classify_nearest_color(c):
     if c is None:
         return None
-    label, _ = min(
-        ((name, dist(c, rgb)) for name, rgb in color_table.items()),
-        key=lambda item: item[1],
+    # Highlights reuse a handful of colors; quantize to 8-bit RGB so repeats
+    # hit the cache.
+    key = tuple(round(v * 255) for v in c)
+    return nearest_color_label(key, COLOR_TABLE)
+
+
+def collect_highlights(page):
+    highlights = []
+    # Prefer annotations if present
+    annots = list(page.annots() or [])
+    for a in annots:
+        colors = getattr(a, "colors", None)
+        c = None
+        if colors and colors.get("fill"):
+            c = colors.get("fill")
+        elif colors and colors.get("stroke"):
+            c = colors.get("stroke")
+        if c:
+            highlights.append({"rect": a.rect, "color": c})
+
+    # Fallback to drawings if no annotations
+    if not annots:
+        for d in page.get_drawings():
+            fill = d.get("fill")
+            rect = d.get("rect")
+            if fill and rect:
+                highlights.append({"rect": rect, "color": fill})
+    return highlights
+
+
+def merge_and_coverage(intervals, line_rect, line_width):
+    # Merge overlapping x-intervals in one sweep, accumulating the covered
+    # width and the right edge of the last merged interval as we go.
+    covered = 0
+    start = end = None
+    for next_start, next_end in sorted(intervals):
+        if end is None or next_start > end:
+            if end is not None:
+                covered += end - start
+            start, end = next_start, next_end
+        elif next_end > end:
+            end = next_end
+    if end is None:
+        # Highlights only touching the line edge cover none of it.
+        return 0.0, line_rect[0]
+    covered += end - start
+    return covered / line_width, end
+
+
+def mark_line_coverage(line, intervals):
+    line_rect = line["bbox"]
+    line_width = max(1.0, line_rect[2] - line_rect[0])
+    coverage_ratio, highlighted_max_x = merge_and_coverage(intervals, line_rect, line_width)
+    line["highlighted_max_x"] = highlighted_max_x
+    line["has_unhighlighted_gap"] = coverage_ratio < 0.95
+    line["has_unhighlighted_after"] = (line_rect[2] - highlighted_max_x) > max(
+        6.0, line_width * 0.1
     )
-    return label
 
 
 def has_unhighlighted_gap_between(lines, upper_y, lower_y):
     for line in lines:
-        y0 = line["lines"][0]["bbox"][1]
-        y1 = line["lines"][0]["bbox"][3]
+        y0 = line["bbox"][1]
+        y1 = line["bbox"][3]
         if y0 > lower_y or y1 < upper_y:
             continue
         if line.get("has_unhighlighted_gap"):
@@ -96,18 +211,29 @@ def has_unhighlighted_gap_between(lines, upper_y, lower_y):
     return False
 
 
-def has_unhighlighted_after_between(lines, upper_y, lower_y):
-    for line in lines:
-        y0 = line["lines"][0]["bbox"][1]
-        y1 = line["lines"][0]["bbox"][3]
-        if y0 > lower_y or y1 < upper_y:
-            continue
-        if line.get("has_unhighlighted_after"):
+def index_unhighlighted_after(lines):
+    # Only lines flagged as having unhighlighted text after the highlight can
+    # block a merge; keep their bboxes sorted by top edge for bisecting.
+    bboxes = [line["bbox"] for line in lines if line.get("has_unhighlighted_after")]
+    bboxes.sort(key=lambda b: b[1])
+    tops = [b[1] for b in bboxes]
+    max_height = max((b[3] - b[1] for b in bboxes), default=0.0)
+    return bboxes, tops, max_height
+
+
+def has_unhighlighted_after_between(index, upper_y, lower_y):
+    bboxes, tops, max_height = index
+    # Walk the tail by index; slicing would copy it for every merge decision.
+    for i in range(bisect_left(tops, upper_y - max_height), len(bboxes)):
+        bbox = bboxes[i]
+        if bbox[1] > lower_y:
+            break
+        if bbox[3] >= upper_y:
             return True
     return False
 
 
-def should_merge_rects(prev_rect, next_rect, lines):
+def should_merge_rects(prev_rect, next_rect, unhighlighted_after):
     prev_height = max(1.0, prev_rect[3] - prev_rect[1])
     y_gap = next_rect[1] - prev_rect[3]
     vertical_overlap = next_rect[1] <= prev_rect[3] and next_rect[3] >= prev_rect[1]
@@ -120,150 +246,182 @@ def should_merge_rects(prev_rect, next_rect, lines):
     if y_gap > max(4.0, prev_height * 0.8):
         return False
 
-    if has_unhighlighted_after_between(lines, prev_rect[1], next_rect[1]):
+    if has_unhighlighted_after_between(unhighlighted_after, prev_rect[1], next_rect[1]):
         return False
 
     return True
 
 
-def main():
-    args = parse_args()
-    pymupdf = require_pymupdf()
+def extract_page_highlights(page, pymupdf):
+    # Per-highlight data is kept in parallel lists indexed by highlight.
+    rects = []
+    colors = []
+    texts = []
+    highlights = collect_highlights(page)
+    for h in highlights:
+        label = classify_nearest_color(h["color"])
+        if not label:
+            continue
+        lines = extract_highlight_text(page, h["rect"])
+        if not lines:
+            continue
+        rects.append(rect_to_tuple(h["rect"]))
+        colors.append(label)
+        texts.append(lines)
 
-    color_table = {
-        "yellow": (1.0, 1.0, 0.0),
-        "green": (0.0, 1.0, 0.0),
-        "blue": (0.0, 1.0, 1.0),
-        "light-blue": (0.6, 0.8, 1.0),
-        "red": (1.0, 0.0, 0.0),
-        "orange": (1.0, 0.6, 0.0),
-        "purple": (0.6, 0.2, 0.8),
-        "pink": (1.0, 0.6, 0.8),
-    }
-
-    doc = pymupdf.open(args.pdf)
-    highlights = []
+    if not rects:
+        return []
 
-    for pi, page in enumerate(doc, start=1):
-        # Prefer annotations if present
-        annots = list(page.annots() or [])
-        for a in annots:
-            colors = getattr(a, "colors", None)
-            c = None
-            if colors and colors.get("fill"):
-                c = colors.get("fill")
-            elif colors and colors.get("stroke"):
-                c = colors.get("stroke")
-            if c:
-                highlights.append({"page": pi, "rect": a.rect, "color": c})
-
-        # Fallback to drawings if no annotations
-        if not annots:
-            for d in page.get_drawings():
-                fill = d.get("fill")
-                rect = d.get("rect")
-                if fill and rect:
-                    highlights.append({"page": pi, "rect": rect, "color": fill})
+    # Image blocks are never used; skip decoding them.
+    flags = pymupdf.TEXTFLAGS_DICT & ~pymupdf.TEXT_PRESERVE_IMAGES
+    lines = extract_lines(page.get_text("dict", flags=flags))
+    line_hits = line_overlaps(lines, rects)
+    for li, line in enumerate(lines):
+        line_rect = line["bbox"]
+        hits = line_hits.get(li, [])
+        highlighted = bool(hits)
+        intervals = []
+        for hi in hits:
+            x0 = max(line_rect[0], rects[hi][0])
+            x1 = min(line_rect[2], rects[hi][2])
+            if x1 > x0:
+                intervals.append((x0, x1))
+        line["highlighted_any"] = highlighted
+        if not highlighted:
+            line["has_unhighlighted_gap"] = False
+            line["has_unhighlighted_after"] = False
+            line["highlighted_max_x"] = None
+            continue
 
-    results = []
-    seen = set()
-    for pi, page in enumerate(doc, start=1):
-        page_highlights = []
-        for h in highlights:
-            if h["page"] != pi:
-                continue
-            label = classify_nearest_color(h["color"], color_table)
-            if not label:
-                continue
-            lines = extract_highlight_text(page, h["rect"])
-            if not lines:
-                continue
-            page_highlights.append(
+        mark_line_coverage(line, intervals)
+
+    unhighlighted_after = index_unhighlighted_after(lines)
+    order = sorted(range(len(rects)), key=lambda i: (rects[i][1], rects[i][0]))
+    grouped = []
+    for i in order:
+        if (
+            grouped
+            and grouped[-1]["color"] == colors[i]
+            and should_merge_rects(grouped[-1]["last_rect"], rects[i], unhighlighted_after)
+        ):
+            grouped[-1]["lines"].extend(texts[i])
+            x0, y0, x1, y1 = grouped[-1]["rect"]
+            nx0, ny0, nx1, ny1 = rects[i]
+            grouped[-1]["rect"] = (min(x0, nx0), min(y0, ny0), max(x1, nx1), max(y1, ny1))
+            grouped[-1]["last_rect"] = rects[i]
+        else:
+            grouped.append(
                 {
-                    "rect": rect_to_tuple(h["rect"]),
-                    "color": label,
-                    "lines": lines,
+                    "rect": rects[i],
+                    "last_rect": rects[i],
+                    "color": colors[i],
+                    "lines": list(texts[i]),
                 }
             )
 
-        if not page_highlights:
-            continue
+    return [{"colors": [item["color"]], "text": " ".join(item["lines"])} for item in grouped]
 
-        lines = extract_lines(page)
-        for line in lines:
-            line_rect = line["lines"][0]["bbox"]
-            highlighted = False
-            intervals = []
-            for h in page_highlights:
-                if not intersects(line_rect, h["rect"]):
-                    continue
-                highlighted = True
-                x0 = max(line_rect[0], h["rect"][0])
-                x1 = min(line_rect[2], h["rect"][2])
-                if x1 > x0:
-                    intervals.append((x0, x1))
-            line["highlighted_any"] = highlighted
-            if not highlighted:
-                line["has_unhighlighted_gap"] = False
-                line["has_unhighlighted_after"] = False
-                line["highlighted_max_x"] = None
-                continue
 
-            intervals.sort()
-            merged = []
-            for start, end in intervals:
-                if not merged or start > merged[-1][1]:
-                    merged.append([start, end])
-                else:
-                    merged[-1][1] = max(merged[-1][1], end)
-            covered = sum(end - start for start, end in merged)
-            line_width = max(1.0, line_rect[2] - line_rect[0])
-            coverage_ratio = covered / line_width
-            highlighted_max_x = max(end for _, end in merged)
-            line["highlighted_max_x"] = highlighted_max_x
-            line["has_unhighlighted_gap"] = coverage_ratio < 0.95
-            line["has_unhighlighted_after"] = (line_rect[2] - highlighted_max_x) > max(
-                6.0, line_width * 0.1
+MIN_PAGES_PER_WORKER = 8
+
+_worker_pymupdf = None
+_worker_doc = None
+
+
+def init_worker(pdf_path):
+    global _worker_pymupdf, _worker_doc
+    _worker_pymupdf = require_pymupdf()
+    _worker_doc = open_pdf(_worker_pymupdf, pdf_path)
+
+
+def process_page(index):
+    return extract_page_highlights(_worker_doc.load_page(index), _worker_pymupdf)
+
+
+def available_cpus():
+    # Unlike os.cpu_count(), the affinity mask honours taskset and cgroup
+    # cpusets, but sched_getaffinity() does not exist on every platform.
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def pool_size(page_count, workers=None):
+    # Starting a worker and reopening the PDF in it costs about as much as
+    # extracting a handful of pages, so by default every worker gets at
+    # least MIN_PAGES_PER_WORKER pages and small documents stay in-process.
+    if workers is None:
+        workers = min(available_cpus(), page_count // MIN_PAGES_PER_WORKER)
+    return max(1, min(workers, page_count))
+
+
+def map_pages(pdf_path, page_count, workers):
+    chunksize = max(1, page_count // (4 * workers))
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=(pdf_path,)
+    ) as pool:
+        yield from pool.map(process_page, range(page_count), chunksize=chunksize)
+
+
+def extract_results(pdf_path, workers=None):
+    pymupdf = require_pymupdf()
+
+    doc = open_pdf(pymupdf, pdf_path)
+    page_count = doc.page_count
+    workers = pool_size(page_count, workers)
+    if workers > 1:
+        # Documents are not picklable, so each worker opens its own copy.
+        doc.close()
+        page_results = map_pages(pdf_path, page_count, workers)
+    else:
+        page_results = (
+            extract_page_highlights(doc.load_page(index), pymupdf) for index in range(page_count)
+        )
+
+    results = []
+    for pi, page_items in enumerate(page_results, start=1):
+        # Duplicates are per page, so the texts seen on a page suffice as keys.
+        seen = set()
+        for item in page_items:
+            if item["text"] in seen:
+                continue
+            seen.add(item["text"])
+            results.append(
+                {
+                    "page": pi,
+                    "colors": item["colors"],
+                    "text": item["text"],
+                }
             )
 
-        page_highlights.sort(key=lambda h: (h["rect"][1], h["rect"][0]))
-        grouped = []
-        for item in page_highlights:
-            if (
-                grouped
-                and grouped[-1]["color"] == item["color"]
-                and should_merge_rects(grouped[-1]["last_rect"], item["rect"], lines)
-            ):
-                grouped[-1]["lines"].extend(item["lines"])
-                x0, y0, x1, y1 = grouped[-1]["rect"]
-                nx0, ny0, nx1, ny1 = item["rect"]
-                grouped[-1]["rect"] = (min(x0, nx0), min(y0, ny0), max(x1, nx1), max(y1, ny1))
-                grouped[-1]["last_rect"] = item["rect"]
-            else:
-                item["last_rect"] = item["rect"]
-                grouped.append(item)
-
-        for item in grouped:
-            text = " ".join(item["lines"])
-            output = {
-                "page": pi,
-                "colors": [item["color"]],
-                "text": text,
-            }
-            key = (output["page"], output["text"])
-            if key not in seen:
-                seen.add(key)
-                results.append(output)
+    return results
 
-    if args.format == "json":
-        print(json.dumps(results, indent=2))
-        return
 
+def format_text(results):
+    # Collect the report and write it in one go rather than line by line.
+    out = []
     for i, item in enumerate(results, start=1):
         colors = ", ".join(item["colors"])
-        print(f"{i}. Page: {item['page']}, Color: {colors}")
-        print(f"\"{item['text']}\"")
-        print()
+        out.append(f"{i}. Page: {item['page']}, Color: {colors}")
+        out.append(f"\"{item['text']}\"")
+        out.append("")
+    return "".join(line + "\n" for line in out)
+
+
+def run(pdf_path, output_format="text", workers=None):
+    results = extract_results(pdf_path, workers)
+    if output_format == "json":
+        return format_json(results).decode("utf-8")
+    return format_text(results)
+
+
+def main():
+    args = parse_args()
+    results = extract_results(args.pdf)
+    if args.format == "json":
+        sys.stdout.buffer.write(format_json(results))
+        return
+    sys.stdout.write(format_text(results))
 
 
 if __name__ == "__main__":
@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+import importlib
 import json
 import subprocess
 import sys
+from collections.abc import Iterator
 from pathlib import Path
+from types import ModuleType
 
 import pytest
 
@@ -23,38 +26,85 @@ def script_path(repo_root: Path) -> Path:
     return repo_root / "skills/pdf-extract-comments/scripts/extract_comments.py"
 
 
-def _run_script(script_path: Path, pdf_path: Path, output_format: str) -> str:
+@pytest.fixture(scope="module")
+def script_module(script_path: Path) -> Iterator[ModuleType]:
+    # Import by name from the scripts directory so that pool workers can
+    # unpickle the module's functions.
+    scripts_dir = str(script_path.parent)
+    sys.path.insert(0, scripts_dir)
+    try:
+        yield importlib.import_module(script_path.stem)
+    finally:
+        sys.path.remove(scripts_dir)
+
+
+def _run_script(
+    script_module: ModuleType, pdf_path: Path, output_format: str, workers: int = 1
+) -> str:
     pytest.importorskip("pymupdf")
-    result = subprocess.run(
-        [
-            sys.executable,
-            str(script_path),
-            str(pdf_path),
-            "--format",
-            output_format,
-        ],
-        check=True,
-        capture_output=True,
-        text=True,
-    )
-    return result.stdout
+    return script_module.run(str(pdf_path), output_format, workers)
 
 
-def test_output_text_matches_expected(fixtures_dir: Path, script_path: Path) -> None:
+def test_output_text_matches_expected(fixtures_dir: Path, script_module: ModuleType) -> None:
     pdf_path = fixtures_dir / "input_okular.pdf"
     expected_path = fixtures_dir / "output_text.txt"
 
-    actual = _run_script(script_path, pdf_path, "text").strip()
+    actual = _run_script(script_module, pdf_path, "text").strip()
     expected = expected_path.read_text().strip()
 
     assert actual == expected
 
 
-def test_output_json_matches_expected(fixtures_dir: Path, script_path: Path) -> None:
+def test_output_json_matches_expected(fixtures_dir: Path, script_module: ModuleType) -> None:
     pdf_path = fixtures_dir / "input_edge.pdf"
     expected_path = fixtures_dir / "output_json.json"
 
-    actual = _run_script(script_path, pdf_path, "json")
+    actual = _run_script(script_module, pdf_path, "json")
     expected = expected_path.read_text()
 
     assert json.loads(actual) == json.loads(expected)
+
+
+def test_command_line_json_matches_expected(fixtures_dir: Path, script_path: Path) -> None:
+    pytest.importorskip("pymupdf")
+    pdf_path = fixtures_dir / "input_edge.pdf"
+    expected_path = fixtures_dir / "output_json.json"
+
+    # One real script run covers argument parsing and the bytes main() writes.
+    result = subprocess.run(
+        [sys.executable, str(script_path), str(pdf_path), "--format", "json"],
+        check=True,
+        capture_output=True,
+    )
+
+    assert json.loads(result.stdout) == json.loads(expected_path.read_text())
+
+
+def test_multi_page_output_matches_across_workers(
+    fixtures_dir: Path, script_module: ModuleType, tmp_path: Path
+) -> None:
+    pymupdf = pytest.importorskip("pymupdf")
+    pdf_path = tmp_path / "multi_page.pdf"
+    with pymupdf.open() as doc, pymupdf.open(fixtures_dir / "input_okular.pdf") as src:
+        for _ in range(4):
+            doc.insert_pdf(src, annots=True)
+        doc.save(pdf_path)
+
+    serial = json.loads(_run_script(script_module, pdf_path, "json", workers=1))
+    pooled = json.loads(_run_script(script_module, pdf_path, "json", workers=2))
+
+    assert pooled == serial
+    assert {item["page"] for item in serial} == {1, 2, 3, 4}
+
+
+def test_pool_size_keeps_small_documents_in_process(
+    script_module: ModuleType, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(script_module, "available_cpus", lambda: 4)
+
+    assert script_module.pool_size(1) == 1
+    assert script_module.pool_size(15) == 1
+    assert script_module.pool_size(16) == 2
+    assert script_module.pool_size(200) == 4
+    assert script_module.pool_size(3, workers=2) == 2
+    assert script_module.pool_size(1, workers=4) == 1
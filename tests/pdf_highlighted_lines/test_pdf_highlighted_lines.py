@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+import importlib
 import json
 import subprocess
 import sys
+from collections.abc import Iterator
 from pathlib import Path
+from types import ModuleType
 
 import pytest
 
@@ -23,38 +26,133 @@ def script_path(repo_root: Path) -> Path:
     return repo_root / "skills/pdf-highlighted-lines/scripts/extract_highlighted_lines.py"
 
 
-def _run_script(script_path: Path, pdf_path: Path, output_format: str) -> str:
+@pytest.fixture(scope="module")
+def script_module(script_path: Path) -> Iterator[ModuleType]:
+    # Import by name from the scripts directory so that pool workers can
+    # unpickle the module's functions.
+    scripts_dir = str(script_path.parent)
+    sys.path.insert(0, scripts_dir)
+    try:
+        yield importlib.import_module(script_path.stem)
+    finally:
+        sys.path.remove(scripts_dir)
+
+
+def _run_script(
+    script_module: ModuleType, pdf_path: Path, output_format: str, workers: int = 1
+) -> str:
     pytest.importorskip("pymupdf")
-    result = subprocess.run(
-        [
-            sys.executable,
-            str(script_path),
-            str(pdf_path),
-            "--format",
-            output_format,
-        ],
-        check=True,
-        capture_output=True,
-        text=True,
-    )
-    return result.stdout
+    return script_module.run(str(pdf_path), output_format, workers)
 
 
-def test_output_text_matches_expected(fixtures_dir: Path, script_path: Path) -> None:
+def test_output_text_matches_expected(fixtures_dir: Path, script_module: ModuleType) -> None:
     pdf_path = fixtures_dir / "input.pdf"
     expected_path = fixtures_dir / "output_text_colors.txt"
 
-    actual = _run_script(script_path, pdf_path, "text").strip()
+    actual = _run_script(script_module, pdf_path, "text").strip()
     expected = expected_path.read_text().strip()
 
     assert actual == expected
 
 
-def test_output_json_matches_expected(fixtures_dir: Path, script_path: Path) -> None:
+def test_output_json_matches_expected(fixtures_dir: Path, script_module: ModuleType) -> None:
     pdf_path = fixtures_dir / "input.pdf"
     expected_path = fixtures_dir / "output_json_colors.json"
 
-    actual = _run_script(script_path, pdf_path, "json")
+    actual = _run_script(script_module, pdf_path, "json")
     expected = expected_path.read_text()
 
     assert json.loads(actual) == json.loads(expected)
+
+
+def test_command_line_json_matches_expected(fixtures_dir: Path, script_path: Path) -> None:
+    pytest.importorskip("pymupdf")
+    pdf_path = fixtures_dir / "input.pdf"
+    expected_path = fixtures_dir / "output_json_colors.json"
+
+    # One real script run covers argument parsing and the bytes main() writes.
+    result = subprocess.run(
+        [sys.executable, str(script_path), str(pdf_path), "--format", "json"],
+        check=True,
+        capture_output=True,
+    )
+
+    assert json.loads(result.stdout) == json.loads(expected_path.read_text())
+
+
+def test_highlight_text_of_rects_cutting_through_glyphs(
+    fixtures_dir: Path, script_module: ModuleType
+) -> None:
+    pymupdf = pytest.importorskip("pymupdf")
+    # Highlights of input.pdf narrowed by 3pt on both sides, so the glyphs at
+    # their ends are only partly inside.
+    expected = {
+        0: ["Lorem ipsum dolor sit amet, consectetur adipiscing elit"],
+        1: ["uctus, interdum erat ut, rutrum"],
+        4: ["Duis eros ipsum"],
+        9: ["Proin aliquam"],
+    }
+
+    with pymupdf.open(fixtures_dir / "input.pdf") as doc:
+        page = doc.load_page(0)
+        highlights = script_module.collect_highlights(page)
+        actual = {
+            hi: script_module.extract_highlight_text(
+                page, pymupdf.Rect(highlights[hi]["rect"]) + (3, 0, -3, 0)
+            )
+            for hi in expected
+        }
+
+    assert actual == expected
+
+
+def test_multi_page_output_matches_across_workers(
+    fixtures_dir: Path, script_module: ModuleType, tmp_path: Path
+) -> None:
+    pymupdf = pytest.importorskip("pymupdf")
+    pdf_path = tmp_path / "multi_page.pdf"
+    with pymupdf.open() as doc, pymupdf.open(fixtures_dir / "input.pdf") as src:
+        for _ in range(4):
+            doc.insert_pdf(src, annots=True)
+        doc.save(pdf_path)
+
+    serial = json.loads(_run_script(script_module, pdf_path, "json", workers=1))
+    pooled = json.loads(_run_script(script_module, pdf_path, "json", workers=2))
+
+    assert pooled == serial
+    assert {item["page"] for item in serial} == {1, 2, 3, 4}
+
+
+def test_pool_size_keeps_small_documents_in_process(
+    script_module: ModuleType, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(script_module, "available_cpus", lambda: 4)
+
+    assert script_module.pool_size(1) == 1
+    assert script_module.pool_size(15) == 1
+    assert script_module.pool_size(16) == 2
+    assert script_module.pool_size(200) == 4
+    assert script_module.pool_size(3, workers=2) == 2
+    assert script_module.pool_size(1, workers=4) == 1
+
+
+def test_edge_touching_highlight_marks_line_unhighlighted(script_module: ModuleType) -> None:
+    line_rect = (10.0, 0.0, 110.0, 10.0)
+
+    assert script_module.merge_and_coverage([], line_rect, 100.0) == (0.0, 10.0)
+
+    line = {"text": "edge", "bbox": line_rect}
+    script_module.mark_line_coverage(line, [])
+
+    assert line["highlighted_max_x"] == 10.0
+    assert line["has_unhighlighted_gap"] is True
+    assert line["has_unhighlighted_after"] is True
+
+
+def test_line_coverage_merges_overlapping_intervals(script_module: ModuleType) -> None:
+    line = {"text": "covered", "bbox": (0.0, 0.0, 100.0, 10.0)}
+    script_module.mark_line_coverage(line, [(40.0, 100.0), (0.0, 50.0)])
+
+    assert line["highlighted_max_x"] == 100.0
+    assert line["has_unhighlighted_gap"] is False
+    assert line["has_unhighlighted_after"] is False